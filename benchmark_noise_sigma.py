@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+"""
+                --------------------------------
+                        >|<   Ekui Astro
+                --------------------------------
+                  Für den König, zu dem Licht!
+
+benchmark_noise_sigma.py
+This *.py file benchmarks noise_sigma.py on realistic image sizes,
+including sampling and writing of results.
+
+@ Last updates: 19. Okt 2026
+@ To-do: ok.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections.abc import Callable
+
+import numpy as np
+from astropy.io import fits
+
+import noise_sigma
+
+# ---
+
+
+def model_image(size: int, sky: float = 20.0, seed: int = 0) -> np.ndarray:
+    """
+    model_image function creates a model image with a flat sky and a
+    few exponential sources.
+
+    Args:
+        size (int): image size, in unit pixel.
+        sky (float, optional): sky level, in unit adu. Defaults to 20.0.
+        seed (int, optional): seed to random number generator.
+            Defaults to 0.
+
+    Returns:
+        np.ndarray: model image.
+    """
+
+    rng = np.random.default_rng(seed=seed)
+    (yy, xx) = np.indices((size, size), dtype=np.float64)
+    im = np.full((size, size), fill_value=sky)
+
+    for _ in range(20):
+        (_x, _y) = rng.uniform(0.0, size, size=2)
+        _r = np.hypot(xx - _x, yy - _y)
+        im += rng.uniform(1e2, 1e4) * np.exp(
+            -_r / rng.uniform(2.0, 0.02 * size)
+        )
+
+    return im
+
+
+def best_of(func: Callable, repeat: int = 3) -> float:
+    """
+    best_of function returns the best wall-clock time of a callable.
+
+    Args:
+        func (Callable): callable object without arguments.
+        repeat (int, optional): number of repeats. Defaults to 3.
+
+    Returns:
+        float: best time, in unit s.
+    """
+
+    times = list()
+
+    for _ in range(repeat):
+        _t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - _t)
+
+    return min(times)
+
+
+def bench_sampling(
+    sizes: list[int], gain: float, gauss_above: float, repeat: int
+) -> None:
+    """
+    bench_sampling function compares exact Poisson sampling with the
+    Gaussian fast path and float32 outputs, on a bright image whose
+    pixels are all above `gauss_above`, and on a sky-dominated image
+    whose pixels are mostly below it.
+
+    Args:
+        sizes (list[int]): image sizes, in unit pixel.
+        gain (float): effective gain, in unit e-.adu^{-1}.
+        gauss_above (float): expected counts above which Gaussian
+            sampling is used.
+        repeat (int): number of repeats.
+    """
+
+    # Case, sky level in unit adu
+    cases = [('bright', 20.0), ('sky', 0.5)]
+
+    print(
+        '{:>6s} {:>8s} {:>8s} {:>28s} {:>10s} {:>8s}'.format(
+            'size', 'case', 'f_gauss', 'mode', 'time [s]', 'speedup'
+        )
+    )
+
+    for _size in sizes:
+
+        for (_case, _sky) in cases:
+            _im = model_image(_size, sky=_sky)
+            _f_gauss = np.mean(_im * gain > gauss_above)
+            _out_64 = (np.empty_like(_im), np.empty_like(_im))
+            _out_32 = (
+                np.empty(_im.shape, dtype=np.float32),
+                np.empty(_im.shape, dtype=np.float32),
+            )
+            _modes = {
+                'poisson, float64': lambda: noise_sigma.noise_sigma(
+                    _im, gain=gain
+                ),
+                'poisson, float64, out': lambda: noise_sigma.noise_sigma(
+                    _im, gain=gain, out=_out_64
+                ),
+                'gauss, float64, out': lambda: noise_sigma.noise_sigma(
+                    _im, gain=gain, gauss_above=gauss_above, out=_out_64
+                ),
+                'gauss, float32, out': lambda: noise_sigma.noise_sigma(
+                    _im, gain=gain, gauss_above=gauss_above, out=_out_32
+                ),
+            }
+
+            _t_ref = None
+
+            for (_mode, _func) in _modes.items():
+                _t = best_of(_func, repeat=repeat)
+                _t_ref = _t_ref or _t
+                print(
+                    '{:>6d} {:>8s} {:>8.3f} {:>28s} {:>10.4f} {:>8.2f}'.format(
+                        _size, _case, _f_gauss, _mode, _t, _t_ref / _t
+                    )
+                )
+
+
+def bench_write(sizes: list[int], gain: float, repeat: int) -> None:
+    """
+    bench_write function compares write throughput and file size of
+    uncompressed and tile-compressed FITS outputs.
+
+    Args:
+        sizes (list[int]): image sizes, in unit pixel.
+        gain (float): effective gain, in unit e-.adu^{-1}.
+        repeat (int): number of repeats.
+    """
+
+    # Name, dtype, compression, quantisation level
+    configs = [
+        ('uncompressed, float64', np.float64, '', 16.0),
+        ('uncompressed, float32', np.float32, '', 16.0),
+        ('RICE_1, q=16', np.float32, 'RICE_1', 16.0),
+        ('RICE_1, q=4', np.float32, 'RICE_1', 4.0),
+        ('GZIP_2, q=16', np.float32, 'GZIP_2', 16.0),
+        ('GZIP_2, lossless', np.float32, 'GZIP_2', 0.0),
+    ]
+
+    print(
+        '{:>6s} {:>28s} {:>10s} {:>10s} {:>10s}'.format(
+            'size', 'mode', 'time [s]', 'MB.s^{-1}', 'size [MB]'
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as _dir:
+        _name = os.path.join(_dir, 'noise.fits')
+
+        for _size in sizes:
+            (_im_noise, _) = noise_sigma.noise_sigma(
+                model_image(_size), gain=gain
+            )
+
+            # Throughput refers to the float64 image in memory
+            _mb = _im_noise.nbytes / 1e6
+
+            for (_mode, _dtype, _compression, _q) in configs:
+                _hdus = fits.HDUList(
+                    noise_sigma.image_hdus(
+                        _im_noise.astype(_dtype),
+                        fits.Header(),
+                        compression=_compression,
+                        quantize_level=_q,
+                    )
+                )
+                _t = best_of(
+                    lambda: _hdus.writeto(_name, overwrite=True),
+                    repeat=repeat,
+                )
+                print(
+                    '{:>6d} {:>28s} {:>10.4f} {:>10.1f} {:>10.2f}'.format(
+                        _size,
+                        _mode,
+                        _t,
+                        _mb / _t,
+                        os.path.getsize(_name) / 1e6,
+                    )
+                )
+
+
+# Main function
+if __name__ == '__main__':
+
+    # Get argument parser
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-n',
+        '--sizes',
+        default=[1024, 2048, 4096],
+        nargs='+',
+        help='image sizes. Defaults to 1024 2048 4096.',
+        type=int,
+    )
+    parser.add_argument(
+        '-g',
+        '--gain',
+        default=50.0,
+        help='[e-.adu^{-1}] effective gain. Defaults to 50.0.',
+        type=float,
+    )
+    parser.add_argument(
+        '-G',
+        '--gauss_above',
+        default=1000.0,
+        help='[e-] expected counts above which Gaussian sampling is used. '
+        'Defaults to 1000.0.',
+        type=float,
+    )
+    parser.add_argument(
+        '-r',
+        '--repeat',
+        default=3,
+        help='number of repeats. Defaults to 3.',
+        type=int,
+    )
+    parser.add_argument(
+        '-m',
+        '--mode',
+        default='all',
+        choices=['all', 'sampling', 'write'],
+        help='benchmark to run. Defaults to all.',
+        type=str,
+    )
+    args = parser.parse_args()
+
+    if args.mode in ('all', 'sampling'):
+        bench_sampling(args.sizes, args.gain, args.gauss_above, args.repeat)
+
+    if args.mode in ('all', 'write'):
+        bench_write(args.sizes, args.gain, args.repeat)
+
+# EOF
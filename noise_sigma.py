@@ -9,52 +9,975 @@
 noise_sigma.py
 This *.py file adds noise to model image and evaluates sigma-map.
 
-@ Last updates: 23. Mär 2023
+@ Last updates: 19. Okt 2026
 @ To-do: ok.
 """
 
 import argparse
+import glob
+import hashlib
 import os
+import re
+import string
+from collections.abc import Iterable
+from concurrent import futures
 
 import numpy as np
 from astropy import time
 from astropy.io import fits
 
+# ---
+
+# Tile compression types supported by astropy
+COMPRESSION_TYPES = ('RICE_1', 'GZIP_1', 'GZIP_2', 'HCOMPRESS_1')
+
+
+def _noise_kernel(
+    scaled: np.ndarray,
+    gain: float,
+    rng: np.random.Generator,
+    im_noise: np.ndarray,
+    gauss_above: float | None = None,
+) -> None:
+    """
+    _noise_kernel function fills image with noise in place, given the
+    scaled image `im * gain`, i.e., expected counts.
+
+    Args:
+        scaled (np.ndarray): scaled image, in unit e-.
+        gain (float): effective gain, in unit e-.adu^{-1}.
+        rng (np.random.Generator): random number generator.
+        im_noise (np.ndarray): output image with noise, filled in place.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None, i.e.,
+            Poisson sampling everywhere.
+    """
+
+    low = None if gauss_above is None else (scaled <= gauss_above)
+
+    if low is None or np.all(low):
+        np.divide(rng.poisson(scaled), gain, out=im_noise)
+    else:
+        # Normal approximation everywhere, filled in place
+        if im_noise.flags.c_contiguous:
+            rng.standard_normal(dtype=im_noise.dtype, out=im_noise)
+        else:
+            im_noise[...] = rng.standard_normal(
+                im_noise.shape, dtype=im_noise.dtype
+            )
+
+        im_noise *= np.sqrt(scaled)
+        im_noise += scaled
+
+        # Exact Poisson below threshold
+        if np.any(low):
+            im_noise[low] = rng.poisson(scaled[low])
+
+        im_noise /= gain
+
+
+def _noise_sigma_kernel(
+    im: np.ndarray,
+    gain: float,
+    rng: np.random.Generator,
+    im_noise: np.ndarray,
+    im_sigma: np.ndarray,
+    gauss_above: float | None = None,
+) -> None:
+    """
+    _noise_sigma_kernel function fills image with noise and sigma-map in
+    place. The scaled image `im * gain` is computed once into `im_sigma`
+    and turned into the sigma-map at the end.
+
+    Args:
+        im (np.ndarray): image.
+        gain (float): effective gain, in unit e-.adu^{-1}.
+        rng (np.random.Generator): random number generator.
+        im_noise (np.ndarray): output image with noise, filled in place.
+        im_sigma (np.ndarray): output sigma-map, filled in place.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None, i.e.,
+            Poisson sampling everywhere.
+    """
+
+    # Expected counts
+    scaled = np.multiply(im, gain, out=im_sigma)
+
+    _noise_kernel(scaled, gain, rng, im_noise, gauss_above=gauss_above)
+
+    np.sqrt(scaled, out=scaled)
+    scaled /= gain
+
+
+def _noise_sigma_block(
+    im: np.ndarray,
+    gain: float,
+    seed_seq: np.random.SeedSequence,
+    im_noise: np.ndarray,
+    im_sigma: np.ndarray,
+    gauss_above: float | None = None,
+) -> None:
+    """
+    _noise_sigma_block function fills one block of image with noise and
+    sigma-map in place, using its own bit generator.
+
+    Args:
+        im (np.ndarray): block of image.
+        gain (float): effective gain, in unit e-.adu^{-1}.
+        seed_seq (np.random.SeedSequence): seed sequence of the block.
+        im_noise (np.ndarray): block of output image with noise.
+        im_sigma (np.ndarray): block of output sigma-map.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None.
+    """
+
+    _noise_sigma_kernel(
+        im,
+        gain,
+        np.random.Generator(np.random.PCG64(seed_seq)),
+        im_noise,
+        im_sigma,
+        gauss_above=gauss_above,
+    )
+
 
 def noise_sigma(
-    im: np.ndarray, gain: float = 50.0, seed: int = 0
+    im: np.ndarray,
+    gain: float = 50.0,
+    seed: int = 0,
+    block_rows: int | None = None,
+    n_threads: int = 1,
+    gauss_above: float | None = None,
+    dtype: np.dtype = np.float64,
+    out: tuple[np.ndarray, np.ndarray] | None = None,
 ) -> tuple[np.ndarray, np.ndarray]:
     """
     noise_sigma function adds noise to model image and evaluates
     sigma-map.
 
+    If `block_rows` is given, the image is split into blocks of
+    `block_rows` rows, each drawn from its own bit generator spawned
+    from `np.random.SeedSequence(seed)`, and the blocks are filled from
+    a pool of `n_threads` threads. The result then depends on `seed`
+    and `block_rows` only, not on `n_threads`.
+
+    If `gauss_above` is given, pixels whose expected counts
+    `im * gain` exceed it are sampled from the normal approximation
+    N(im * gain, im * gain), which is much cheaper than Poisson
+    sampling at high counts.
+
     Args:
         im (np.ndarray): image.
         gain (float, optional): effective gain, in unit e-.adu^{-1}.
             Defaults to 50.0.
         seed (int, optional): seed to random number generator.
             Defaults to 0.
+        block_rows (int | None, optional): number of rows per block in
+            parallel mode. Defaults to None, i.e., a single generator.
+        n_threads (int, optional): number of threads in parallel mode.
+            Defaults to 1.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None, i.e.,
+            Poisson sampling everywhere.
+        dtype (np.dtype, optional): dtype of outputs, float32 or
+            float64. Ignored if `out` is given. Defaults to np.float64.
+        out (tuple[np.ndarray, np.ndarray] | None, optional): arrays to
+            write image with noise and sigma-map into. Defaults to None.
 
     Returns:
         tuple[np.ndarray, np.ndarray]: image with noise added and
             corresponding sigma-map.
     """
 
-    rng = np.random.default_rng(seed=seed)
+    im = np.asarray(im)
+
+    if out is None:
+        out = (
+            np.empty(im.shape, dtype=dtype),
+            np.empty(im.shape, dtype=dtype),
+        )
+
+    (im_noise, im_sigma) = out
 
-    im_noise = rng.poisson(im * gain) / gain
-    im_sigma = np.sqrt(im * gain) / gain
+    if block_rows is None:
+        _noise_sigma_kernel(
+            im,
+            gain,
+            np.random.default_rng(seed=seed),
+            im_noise,
+            im_sigma,
+            gauss_above=gauss_above,
+        )
+
+        return (im_noise, im_sigma)
+
+    if block_rows < 1:
+        raise ValueError('noise_sigma: block_rows should be positive.')
+
+    n_rows = im.shape[0]
+    slices = [
+        slice(_i, min(_i + block_rows, n_rows))
+        for _i in range(0, n_rows, block_rows)
+    ]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(slices))
+
+    # Blocks are independent, sampling releases the GIL
+    with futures.ThreadPoolExecutor(max_workers=max(n_threads, 1)) as _ex:
+        _jobs = [
+            _ex.submit(
+                _noise_sigma_block,
+                im[_sl],
+                gain,
+                _ss,
+                im_noise[_sl],
+                im_sigma[_sl],
+                gauss_above,
+            )
+            for (_ss, _sl) in zip(seed_seqs, slices)
+        ]
+
+        for _job in _jobs:
+            _job.result()
 
     return (im_noise, im_sigma)
 
 
+def noise_realisations(
+    im: np.ndarray,
+    result_name: str,
+    n_realisations: int,
+    gain: float = 50.0,
+    seed: int = 0,
+    gauss_above: float | None = None,
+    dtype: np.dtype = np.float64,
+    header: fits.Header | None = None,
+) -> np.ndarray:
+    """
+    noise_realisations function generates independent noise
+    realisations of a model image and streams them plane by plane into
+    a cube, either a FITS file or, if `result_name` ends with '.npy', a
+    memory-mapped `.npy` file. The sigma-map is evaluated only once, and
+    memory usage is independent of the number of realisations. The k-th
+    realisation is drawn from the k-th generator spawned from
+    `np.random.SeedSequence(seed)`.
+
+    Args:
+        im (np.ndarray): image.
+        result_name (str): result filename, '*.fits' or '*.npy'.
+        n_realisations (int): number of realisations.
+        gain (float, optional): effective gain, in unit e-.adu^{-1}.
+            Defaults to 50.0.
+        seed (int, optional): seed to random number generator.
+            Defaults to 0.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None.
+        dtype (np.dtype, optional): dtype of outputs.
+            Defaults to np.float64.
+        header (fits.Header | None, optional): header of FITS cube.
+            Defaults to None.
+
+    Returns:
+        np.ndarray: sigma-map.
+    """
+
+    if n_realisations < 1:
+        raise ValueError(
+            'noise_realisations: n_realisations should be positive.'
+        )
+
+    im = np.asarray(im)
+    dtype = np.dtype(dtype)
+    shape = (n_realisations, *im.shape)
+    seed_seqs = np.random.SeedSequence(seed).spawn(n_realisations)
+
+    # Expected counts, shared by all realisations
+    scaled = np.multiply(im, gain, dtype=dtype)
+    im_noise = np.empty(im.shape, dtype=dtype)
+
+    if result_name.endswith('.npy'):
+        cube = np.lib.format.open_memmap(
+            result_name, mode='w+', dtype=dtype, shape=shape
+        )
+
+        for (_k, _ss) in enumerate(seed_seqs):
+            _noise_kernel(
+                scaled,
+                gain,
+                np.random.Generator(np.random.PCG64(_ss)),
+                cube[_k],
+                gauss_above=gauss_above,
+            )
+
+        cube.flush()
+        del cube
+    else:
+        # Structural keywords follow the cube
+        _header = fits.Header()
+        _header['SIMPLE'] = True
+        _header['BITPIX'] = -8 * dtype.itemsize
+        _header['NAXIS'] = len(shape)
+
+        for (_i, _n) in enumerate(reversed(shape)):
+            _header['NAXIS{}'.format(_i + 1)] = _n
+
+        if header is not None:
+            _header.extend(header.copy(strip=True))
+
+        # StreamingHDU appends to existing files, overwrite instead
+        if os.path.exists(result_name):
+            os.remove(result_name)
+
+        _stream = fits.StreamingHDU(result_name, _header)
+
+        for _ss in seed_seqs:
+            _noise_kernel(
+                scaled,
+                gain,
+                np.random.Generator(np.random.PCG64(_ss)),
+                im_noise,
+                gauss_above=gauss_above,
+            )
+            _stream.write(im_noise)
+
+        _stream.close()
+
+    np.sqrt(scaled, out=scaled)
+    scaled /= gain
+
+    return scaled
+
+
+def welford_update(
+    count: np.ndarray, mean: np.ndarray, m2: np.ndarray, frame: np.ndarray
+) -> None:
+    """
+    welford_update function adds one frame to per-pixel running mean and
+    sum of squared deviations in place, following Welford (1962).
+    Non-finite pixels of the frame are skipped.
+
+    Args:
+        count (np.ndarray): per-pixel number of frames, updated in place.
+        mean (np.ndarray): per-pixel running mean, updated in place.
+        m2 (np.ndarray): per-pixel sum of squared deviations from mean,
+            updated in place.
+        frame (np.ndarray): frame.
+    """
+
+    valid = np.isfinite(frame)
+    count += valid
+
+    delta = np.subtract(frame, mean, where=valid, out=np.zeros_like(mean))
+    mean += np.divide(delta, count, where=valid, out=np.zeros_like(mean))
+
+    # delta * (frame - updated mean)
+    m2 += np.multiply(
+        delta,
+        np.subtract(frame, mean, where=valid, out=np.zeros_like(mean)),
+    )
+
+
+def stack_sigma(
+    frames: Iterable[np.ndarray], ddof: int = 1
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    stack_sigma function estimates empirical per-pixel mean and scatter
+    of a stack of frames, consuming the frames one at a time. Memory
+    usage is independent of the number of frames.
+
+    Args:
+        frames (Iterable[np.ndarray]): frames of the same shape.
+        ddof (int, optional): delta degrees of freedom of the scatter.
+            Defaults to 1.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: mean, sigma-map and
+            number of frames per pixel.
+    """
+
+    count = mean = m2 = None
+
+    for _frame in frames:
+
+        if count is None:
+            count = np.zeros(np.shape(_frame), dtype=np.int64)
+            mean = np.zeros(np.shape(_frame), dtype=np.float64)
+            m2 = np.zeros(np.shape(_frame), dtype=np.float64)
+
+        welford_update(count, mean, m2, _frame)
+
+    if count is None:
+        raise ValueError('stack_sigma: no frames are given.')
+
+    im_sigma = np.full(mean.shape, fill_value=np.nan)
+    np.divide(m2, count - ddof, where=(count > ddof), out=im_sigma)
+    np.sqrt(im_sigma, out=im_sigma)
+
+    mean[count == 0] = np.nan
+
+    return (mean, im_sigma, count)
+
+
+def file_key(filename: str, root: str = '') -> int:
+    """
+    file_key function returns a stable integer key of a file, derived
+    from its path relative to `root`, so that its seed does not depend
+    on which other files are processed, and files with the same
+    basename in different directories get different keys.
+
+    Args:
+        filename (str): filename.
+        root (str, optional): root directory of relative paths.
+            Defaults to '', i.e., the current working directory.
+
+    Returns:
+        int: key.
+    """
+
+    path = os.path.relpath(os.path.abspath(filename), os.path.abspath(root))
+
+    return int.from_bytes(
+        hashlib.sha256(path.replace(os.sep, '/').encode('utf-8')).digest(),
+        'little',
+    )
+
+
+def derive_seed(seed: int, *keys: int) -> int:
+    """
+    derive_seed function derives an independent seed from a base seed
+    and a sequence of integer keys, e.g., file, HDU and plane indices.
+
+    Args:
+        seed (int): base seed.
+        *keys (int): integer keys.
+
+    Returns:
+        int: derived seed.
+    """
+
+    return int(
+        np.random.SeedSequence([seed, *keys]).generate_state(
+            1, dtype=np.uint64
+        )[0]
+    )
+
+
+def image_hdus(
+    data: np.ndarray,
+    header: fits.Header,
+    primary: bool = True,
+    compression: str = '',
+    quantize_level: float = 16.0,
+) -> list[fits.PrimaryHDU | fits.ImageHDU]:
+    """
+    image_hdus function wraps image into HDUs, optionally tile-compressed.
+    A compressed image cannot be the primary HDU, so an empty primary HDU
+    is prepended in that case.
+
+    Args:
+        data (np.ndarray): image.
+        header (fits.Header): header.
+        primary (bool, optional): whether image is the primary HDU.
+            Defaults to True.
+        compression (str, optional): compression type, one of
+            `COMPRESSION_TYPES`. Defaults to '', i.e., uncompressed.
+        quantize_level (float, optional): quantisation level of floating
+            point images; 0.0 means lossless, GZIP only.
+            Defaults to 16.0.
+
+    Returns:
+        list[fits.PrimaryHDU | fits.ImageHDU]: HDUs.
+    """
+
+    if compression and quantize_level <= 0 and not compression.startswith(
+        'GZIP'
+    ):
+        raise ValueError(
+            'image_hdus: lossless quantize_level <= 0 requires GZIP_1 or '
+            'GZIP_2, got {}.'.format(compression)
+        )
+
+    if not compression:
+        _cls = fits.PrimaryHDU if primary else fits.ImageHDU
+
+        return [_cls(header=header, data=data)]
+
+    hdus = [fits.PrimaryHDU()] if primary else []
+    hdus.append(
+        fits.CompImageHDU(
+            data=data,
+            header=header.copy(strip=True),
+            compression_type=compression,
+            quantize_level=quantize_level,
+        )
+    )
+
+    return hdus
+
+
+def noise_sigma_file(
+    filename: str,
+    result_name: str,
+    sigma_name: str = '',
+    gain: float = 50.0,
+    seed: int = 0,
+    block_rows: int | None = None,
+    n_threads: int = 1,
+    gauss_above: float | None = None,
+    dtype: np.dtype = np.float64,
+    compression: str = '',
+    quantize_level: float = 16.0,
+) -> str:
+    """
+    noise_sigma_file function adds noise to every image HDU of a FITS
+    file and evaluates the corresponding sigma-maps. Cubes are processed
+    plane by plane; each plane gets a seed derived from `seed`, the HDU
+    index and the plane index. Non-image HDUs are copied as they are.
+
+    Args:
+        filename (str): filename.
+        result_name (str): result filename.
+        sigma_name (str, optional): sigma filename. Defaults to '', i.e.,
+            the sigma-maps are not saved.
+        gain (float, optional): effective gain, in unit e-.adu^{-1}.
+            Defaults to 50.0.
+        seed (int, optional): seed of the file. Defaults to 0.
+        block_rows (int | None, optional): number of rows per block in
+            parallel mode. Defaults to None.
+        n_threads (int, optional): number of threads in parallel mode.
+            Defaults to 1.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None.
+        dtype (np.dtype, optional): dtype of outputs.
+            Defaults to np.float64.
+        compression (str, optional): tile compression type.
+            Defaults to '', i.e., uncompressed.
+        quantize_level (float, optional): quantisation level of
+            compression. Defaults to 16.0.
+
+    Returns:
+        str: result filename.
+    """
+
+    comment = 'noise_sigma: created from, {}, at, {}.'.format(
+        filename, time.Time.now().fits
+    )
+    hdus_noise = list()
+    hdus_sigma = list()
+
+    # Memory-mapped unless scaled, e.g., BZERO of uint16 frames
+    with fits.open(filename) as _h:
+
+        for (_i, _hdu) in enumerate(_h):
+            _header = _hdu.header.copy()
+
+            if not (
+                isinstance(_hdu, (fits.PrimaryHDU, fits.ImageHDU))
+                and _hdu.data is not None
+                and _hdu.data.ndim >= 2
+            ):
+                hdus_noise.append(_hdu.copy())
+                hdus_sigma.append(_hdu.copy())
+
+                continue
+
+            _data = _hdu.data
+            _planes = _data.reshape(-1, *_data.shape[-2:])
+            _im_noise = np.empty(_planes.shape, dtype=dtype)
+            _im_sigma = np.empty(_planes.shape, dtype=dtype)
+
+            for _k in range(_planes.shape[0]):
+                noise_sigma(
+                    _planes[_k],
+                    gain=gain,
+                    seed=derive_seed(seed, _i, _k),
+                    block_rows=block_rows,
+                    n_threads=n_threads,
+                    gauss_above=gauss_above,
+                    out=(_im_noise[_k], _im_sigma[_k]),
+                )
+
+            _header.update({'comment': comment})
+
+            for (_hdus, _im) in [
+                (hdus_noise, _im_noise),
+                (hdus_sigma, _im_sigma),
+            ]:
+                _hdus.extend(
+                    image_hdus(
+                        _im.reshape(_data.shape),
+                        _header,
+                        primary=(_i == 0),
+                        compression=compression,
+                        quantize_level=quantize_level,
+                    )
+                )
+
+        # Save results to file, before memory-mapped data are released
+        fits.HDUList(hdus_noise).writeto(result_name, overwrite=True)
+
+        if sigma_name:
+            fits.HDUList(hdus_sigma).writeto(sigma_name, overwrite=True)
+
+    return result_name
+
+
+def _noise_sigma_file_star(kw_args: dict) -> str:
+    """
+    _noise_sigma_file_star function unpacks keyword arguments for
+    `noise_sigma_file` in worker processes.
+
+    Args:
+        kw_args (dict): keyword arguments.
+
+    Returns:
+        str: result filename.
+    """
+
+    return noise_sigma_file(**kw_args)
+
+
+def _output_pattern(name_format: str) -> re.Pattern | None:
+    """
+    _output_pattern function converts the basename part of an output
+    format into a regular expression matching its outputs.
+
+    Args:
+        name_format (str): format of output filename.
+
+    Returns:
+        re.Pattern | None: pattern, None if the format has no literal
+            text and would match any file.
+    """
+
+    fields = {
+        'stem': '.+',
+        'ext': r'(\.[^.]*)?',
+        'dir': '.*',
+        'index': r'\d+',
+    }
+    pattern = ''
+    literal = ''
+
+    for (_text, _field, _, _) in string.Formatter().parse(
+        name_format.split('/')[-1]
+    ):
+        pattern += re.escape(_text)
+        literal += _text
+
+        if _field is not None:
+            pattern += fields.get(_field, '.*')
+
+    return re.compile(pattern) if literal else None
+
+
+def expand_filenames(
+    patterns: list[str], file_list: str = '', exclude_formats: list[str] = ()
+) -> list[str]:
+    """
+    expand_filenames function expands glob patterns and a file list into
+    a sorted list of unique filenames. Files whose basenames match any of
+    `exclude_formats`, e.g., outputs of a previous run, are skipped.
+
+    Args:
+        patterns (list[str]): glob patterns.
+        file_list (str, optional): text file with one filename per line.
+            Defaults to ''.
+        exclude_formats (list[str], optional): formats of output
+            filenames to skip. Defaults to ().
+
+    Returns:
+        list[str]: filenames.
+    """
+
+    filenames = set()
+
+    for _p in patterns:
+        filenames.update(glob.glob(_p, recursive=True))
+
+    if file_list:
+
+        with open(file_list, 'r') as _f:
+            filenames.update(_l.strip() for _l in _f if _l.strip())
+
+    excludes = [_output_pattern(_fmt) for _fmt in exclude_formats if _fmt]
+    excludes = [_p for _p in excludes if _p is not None]
+
+    return sorted(
+        _f
+        for _f in filenames
+        if not any(_p.fullmatch(os.path.basename(_f)) for _p in excludes)
+    )
+
+
+def output_name(
+    filename: str, name_format: str, index: int, output_dir: str = ''
+) -> str:
+    """
+    output_name function formats an output filename. Fields `{stem}`,
+    `{ext}`, `{dir}` and `{index}` are available in `name_format`.
+
+    Args:
+        filename (str): input filename.
+        name_format (str): format of output filename, e.g.,
+            '{stem}_noise{ext}'.
+        index (int): index of input file.
+        output_dir (str, optional): output directory. Defaults to '',
+            i.e., the directory of input file.
+
+    Returns:
+        str: output filename.
+    """
+
+    (_dir, _base) = os.path.split(filename)
+    (_stem, _ext) = os.path.splitext(_base)
+
+    return os.path.join(
+        output_dir or _dir,
+        name_format.format(stem=_stem, ext=_ext, dir=_dir, index=index),
+    )
+
+
+def noise_sigma_batch(
+    filenames: list[str],
+    result_format: str = '{stem}_noise{ext}',
+    sigma_format: str = '',
+    output_dir: str = '',
+    gain: float = 50.0,
+    seed: int = 0,
+    block_rows: int | None = None,
+    n_threads: int = 1,
+    n_processes: int = 1,
+    gauss_above: float | None = None,
+    dtype: np.dtype = np.float64,
+    compression: str = '',
+    quantize_level: float = 16.0,
+    seed_root: str = '',
+) -> list[str]:
+    """
+    noise_sigma_batch function runs `noise_sigma_file` over many files
+    in a pool of worker processes, which stay alive across files. All
+    output filenames are checked to be unique and distinct from inputs
+    before any file is processed. Each
+    file gets a seed derived from `seed` and `file_key` of its path
+    relative to `seed_root`, independent of the other files in the
+    list.
+
+    Args:
+        filenames (list[str]): filenames.
+        result_format (str, optional): format of result filenames.
+            Defaults to '{stem}_noise{ext}'.
+        sigma_format (str, optional): format of sigma filenames.
+            Defaults to '', i.e., the sigma-maps are not saved.
+        output_dir (str, optional): output directory. Defaults to '',
+            i.e., the directory of each input file.
+        gain (float, optional): effective gain, in unit e-.adu^{-1}.
+            Defaults to 50.0.
+        seed (int, optional): base seed. Defaults to 0.
+        block_rows (int | None, optional): number of rows per block in
+            parallel mode. Defaults to None.
+        n_threads (int, optional): number of threads per process.
+            Defaults to 1.
+        n_processes (int, optional): number of worker processes.
+            Defaults to 1.
+        gauss_above (float | None, optional): expected counts above
+            which Gaussian sampling is used. Defaults to None.
+        dtype (np.dtype, optional): dtype of outputs.
+            Defaults to np.float64.
+        compression (str, optional): tile compression type.
+            Defaults to '', i.e., uncompressed.
+        quantize_level (float, optional): quantisation level of
+            compression. Defaults to 16.0.
+        seed_root (str, optional): root directory of paths keying the
+            seeds. Defaults to '', i.e., the current working directory.
+
+    Returns:
+        list[str]: result filenames.
+    """
+
+    jobs = [
+        {
+            'filename': _f,
+            'result_name': output_name(_f, result_format, _i, output_dir),
+            'sigma_name': (
+                output_name(_f, sigma_format, _i, output_dir)
+                if sigma_format
+                else ''
+            ),
+            'gain': gain,
+            'seed': derive_seed(seed, file_key(_f, root=seed_root)),
+            'block_rows': block_rows,
+            'n_threads': n_threads,
+            'gauss_above': gauss_above,
+            'dtype': dtype,
+            'compression': compression,
+            'quantize_level': quantize_level,
+        }
+        for (_i, _f) in enumerate(filenames)
+    ]
+
+    # Outputs should neither collide nor overwrite inputs
+    names_in = {os.path.abspath(_f) for _f in filenames}
+    names_out = set()
+
+    for _job in jobs:
+
+        for _name in (_job['result_name'], _job['sigma_name']):
+
+            if not _name:
+                continue
+
+            _abs = os.path.abspath(_name)
+
+            if _abs in names_in:
+                raise ValueError(
+                    'noise_sigma_batch: output {} overwrites an input '
+                    'file.'.format(_name)
+                )
+
+            if _abs in names_out:
+                raise ValueError(
+                    'noise_sigma_batch: output {} is not unique, add '
+                    '{{dir}} or {{index}} to its format.'.format(_name)
+                )
+
+            names_out.add(_abs)
+
+    for _dir in {os.path.dirname(_name) for _name in names_out}:
+        os.makedirs(_dir, exist_ok=True)
+
+    if n_processes <= 1:
+        return [_noise_sigma_file_star(_job) for _job in jobs]
+
+    with futures.ProcessPoolExecutor(max_workers=n_processes) as _ex:
+        return list(
+            _ex.map(
+                _noise_sigma_file_star,
+                jobs,
+                chunksize=max(len(jobs) // (4 * n_processes), 1),
+            )
+        )
+
+
+def stack_sigma_files(
+    filenames: list[str],
+    result_name: str,
+    model_name: str = '',
+    gain: float = 50.0,
+    hdu: int = 0,
+    tile_rows: int | None = None,
+    ddof: int = 1,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    stack_sigma_files function estimates the empirical sigma-map of a
+    stack of exposures with `stack_sigma` and compares it with the
+    analytic sigma-map `sqrt(im * gain) / gain`, where `im` is the model
+    image, or the stack mean if no model is given. If `tile_rows` is
+    given, the stack is processed tile by tile, so that only one tile of
+    each frame is read and scaled at a time. All frames and the model
+    should have the same shape.
+
+    The result file holds the empirical sigma-map in the primary HDU,
+    and extensions 'MEAN', 'ANALYTIC', 'RATIO' (empirical over analytic)
+    and 'NFRAME'.
+
+    Args:
+        filenames (list[str]): filenames of exposures.
+        result_name (str): result filename.
+        model_name (str, optional): filename of model image.
+            Defaults to '', i.e., the stack mean is used.
+        gain (float, optional): effective gain, in unit e-.adu^{-1}.
+            Defaults to 50.0.
+        hdu (int, optional): index of image HDU. Defaults to 0.
+        tile_rows (int | None, optional): number of rows per tile.
+            Defaults to None, i.e., whole frames.
+        ddof (int, optional): delta degrees of freedom of the scatter.
+            Defaults to 1.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: empirical sigma-map and its ratio
+            to analytic sigma-map.
+    """
+
+    if not filenames:
+        raise ValueError('stack_sigma_files: no filenames are given.')
+
+    # Shape from header, without loading data
+    with fits.open(filenames[0]) as _h:
+        shape = _h[hdu].shape
+        header = _h[hdu].header.copy(strip=True)
+
+    n_rows = shape[0]
+    tile_rows = tile_rows or n_rows
+
+    def _frames(sl: slice) -> Iterable[np.ndarray]:
+        for _f in filenames:
+            with fits.open(_f) as _h:
+
+                if _h[hdu].shape != shape:
+                    raise ValueError(
+                        'stack_sigma_files: shape {} of {} differs from '
+                        '{}.'.format(_h[hdu].shape, _f, shape)
+                    )
+
+                # Section reads and scales only the tile, e.g., BZERO
+                yield np.array(_h[hdu].section[sl], dtype=np.float64)
+
+    im_mean = np.empty(shape, dtype=np.float64)
+    im_sigma = np.empty(shape, dtype=np.float64)
+    im_count = np.empty(shape, dtype=np.int64)
+
+    for _i in range(0, n_rows, tile_rows):
+        _sl = slice(_i, min(_i + tile_rows, n_rows))
+        (im_mean[_sl], im_sigma[_sl], im_count[_sl]) = stack_sigma(
+            _frames(_sl), ddof=ddof
+        )
+
+    if model_name:
+        with fits.open(model_name) as _h:
+            im_model = _h[hdu].data.astype(np.float64)
+
+        if im_model.shape != shape:
+            raise ValueError(
+                'stack_sigma_files: shape {} of model {} differs from '
+                '{}.'.format(im_model.shape, model_name, shape)
+            )
+    else:
+        im_model = im_mean
+
+    im_analytic = np.sqrt(im_model * gain) / gain
+    im_ratio = np.full(shape, fill_value=np.nan)
+    np.divide(im_sigma, im_analytic, where=(im_analytic > 0), out=im_ratio)
+
+    header.update(
+        {
+            'comment': 'noise_sigma: stack of, {}, frames, at, {}.'.format(
+                len(filenames), time.Time.now().fits
+            )
+        }
+    )
+
+    fits.HDUList(
+        [
+            fits.PrimaryHDU(header=header, data=im_sigma),
+            fits.ImageHDU(data=im_mean, name='MEAN'),
+            fits.ImageHDU(data=im_analytic, name='ANALYTIC'),
+            fits.ImageHDU(data=im_ratio, name='RATIO'),
+            fits.ImageHDU(data=im_count, name='NFRAME'),
+        ]
+    ).writeto(result_name, overwrite=True)
+
+    return (im_sigma, im_ratio)
+
+
 # Main function
 if __name__ == '__main__':
 
     # Get argument parser
     parser = argparse.ArgumentParser()
-    parser.add_argument('filename', help='filename.', type=str)
-    parser.add_argument('result_name', help='result filename.', type=str)
+    parser.add_argument('filename', nargs='?', help='filename.', type=str)
+    parser.add_argument(
+        'result_name', nargs='?', help='result filename.', type=str
+    )
     parser.add_argument(
         '-s', '--sigma_name', default='', help='sigma filename.', type=str
     )
@@ -72,6 +995,135 @@ if __name__ == '__main__':
         help='seed to random number generator. Defaults to 0.',
         type=int,
     )
+    parser.add_argument(
+        '-b',
+        '--block_rows',
+        default=0,
+        help='rows per block in parallel mode. Defaults to 0, i.e., '
+        'a single generator.',
+        type=int,
+    )
+    parser.add_argument(
+        '-t',
+        '--threads',
+        default=os.cpu_count() or 1,
+        help='number of threads in parallel mode. Defaults to CPU count.',
+        type=int,
+    )
+    parser.add_argument(
+        '-B',
+        '--batch',
+        default=[],
+        nargs='+',
+        help='batch mode, glob patterns of filenames.',
+        type=str,
+    )
+    parser.add_argument(
+        '-L',
+        '--file_list',
+        default='',
+        help='batch mode, text file with one filename per line.',
+        type=str,
+    )
+    parser.add_argument(
+        '-r',
+        '--result_format',
+        default='{stem}_noise{ext}',
+        help='batch mode, format of result filenames, with fields {stem}, '
+        '{ext}, {dir} and {index}. Defaults to \'{stem}_noise{ext}\'.',
+        type=str,
+    )
+    parser.add_argument(
+        '--sigma_format',
+        default='',
+        help='batch mode, format of sigma filenames, e.g., '
+        '\'{stem}_sigma{ext}\'.',
+        type=str,
+    )
+    parser.add_argument(
+        '-o',
+        '--output_dir',
+        default='',
+        help='batch mode, output directory. Defaults to input directory.',
+        type=str,
+    )
+    parser.add_argument(
+        '--seed_root',
+        default='',
+        help='batch mode, root directory of file paths keying per-file '
+        'seeds. Defaults to current working directory.',
+        type=str,
+    )
+    parser.add_argument(
+        '-j',
+        '--processes',
+        default=os.cpu_count() or 1,
+        help='batch mode, number of worker processes. Defaults to CPU '
+        'count.',
+        type=int,
+    )
+    parser.add_argument(
+        '-G',
+        '--gauss_above',
+        default=0.0,
+        help='[e-] expected counts above which Gaussian sampling is used. '
+        'Defaults to 0.0, i.e., Poisson sampling everywhere.',
+        type=float,
+    )
+    parser.add_argument(
+        '-d',
+        '--dtype',
+        default='float64',
+        choices=['float32', 'float64'],
+        help='dtype of outputs. Defaults to float64.',
+        type=str,
+    )
+    parser.add_argument(
+        '-K',
+        '--realisations',
+        default=0,
+        help='number of noise realisations streamed into a cube, FITS '
+        'or *.npy. Defaults to 0, i.e., a single noisy image.',
+        type=int,
+    )
+    parser.add_argument(
+        '-c',
+        '--compression',
+        default='',
+        choices=['', *COMPRESSION_TYPES],
+        help='tile compression type of FITS outputs. Cubes of realisations '
+        'are never compressed. Defaults to \'\', i.e., uncompressed.',
+        type=str,
+    )
+    parser.add_argument(
+        '-q',
+        '--quantize_level',
+        default=16.0,
+        help='quantisation level of compression, 0.0 for lossless, GZIP_* '
+        'only. Defaults to 16.0.',
+        type=float,
+    )
+    parser.add_argument(
+        '--stack',
+        default='',
+        help='stack mode, estimate empirical sigma-map of exposures given '
+        'by -B or -L and save it with a comparison to analytic sigma-map '
+        'to this filename.',
+        type=str,
+    )
+    parser.add_argument(
+        '--model',
+        default='',
+        help='stack mode, model image for analytic sigma-map. Defaults to '
+        'stack mean.',
+        type=str,
+    )
+    parser.add_argument(
+        '--tile_rows',
+        default=0,
+        help='stack mode, rows per tile. Defaults to 0, i.e., whole frames.',
+        type=int,
+    )
     args = parser.parse_args()
 
     # Parse parameters
@@ -80,33 +1132,123 @@ if __name__ == '__main__':
     sigma_name = args.sigma_name
     gain = args.gain
     seed = args.seed
+    block_rows = args.block_rows or None
+    n_threads = args.threads
+    gauss_above = args.gauss_above or None
+    dtype = np.dtype(args.dtype)
+    n_realisations = args.realisations
+    compression = args.compression
+    quantize_level = args.quantize_level
 
-    # Get image
-    with fits.open(filename) as _h:
-        im_data = _h[0].data.copy()
-        header = _h[0].header.copy()
+    if compression and quantize_level <= 0 and not compression.startswith(
+        'GZIP'
+    ):
+        parser.error('quantize_level <= 0 requires GZIP_1 or GZIP_2.')
 
-    # Get image with noise and sigma map
-    (im_noise, im_sigma) = noise_sigma(im_data, gain=gain, seed=seed)
+    # Stack mode
+    if args.stack:
+        filenames = expand_filenames(args.batch, args.file_list)
+        (_, im_ratio) = stack_sigma_files(
+            filenames,
+            args.stack,
+            model_name=args.model,
+            gain=gain,
+            tile_rows=args.tile_rows or None,
+        )
 
-    header.update(
-        {
-            'comment': 'noise_sigma: created from, {}, at, {}.'.format(
-                filename, time.Time.now().fits
+        print(
+            'noise_sigma: done, {} frames, median ratio {:.4f}.'.format(
+                len(filenames), np.nanmedian(im_ratio)
             )
-        }
-    )
+        )
 
-    # Save results to file
-    fits.PrimaryHDU(header=header, data=im_noise).writeto(
-        result_name, overwrite=True
-    )
+    # Batch mode
+    elif args.batch or args.file_list:
+        filenames = expand_filenames(
+            args.batch,
+            args.file_list,
+            exclude_formats=[args.result_format, args.sigma_format],
+        )
+        noise_sigma_batch(
+            filenames,
+            result_format=args.result_format,
+            sigma_format=args.sigma_format,
+            output_dir=args.output_dir,
+            gain=gain,
+            seed=seed,
+            block_rows=block_rows,
+            n_threads=1 if args.processes > 1 else n_threads,
+            n_processes=args.processes,
+            gauss_above=gauss_above,
+            dtype=dtype,
+            compression=compression,
+            quantize_level=quantize_level,
+            seed_root=args.seed_root,
+        )
+
+        print('noise_sigma: done, {} files.'.format(len(filenames)))
+    else:
+
+        if not (filename and result_name):
+            parser.error('filename and result_name are required.')
+
+        # Get image
+        with fits.open(filename) as _h:
+            im_data = _h[0].data.copy()
+            header = _h[0].header.copy()
 
-    if sigma_name:
-        fits.PrimaryHDU(header=header, data=im_sigma).writeto(
-            sigma_name, overwrite=True
+        header.update(
+            {
+                'comment': 'noise_sigma: created from, {}, at, {}.'.format(
+                    filename, time.Time.now().fits
+                )
+            }
         )
 
-    print('noise_sigma: done.')
+        if n_realisations > 0:
+            # Stream realisations into a cube
+            im_sigma = noise_realisations(
+                im_data,
+                result_name,
+                n_realisations,
+                gain=gain,
+                seed=seed,
+                gauss_above=gauss_above,
+                dtype=dtype,
+                header=header,
+            )
+        else:
+            # Get image with noise and sigma map
+            (im_noise, im_sigma) = noise_sigma(
+                im_data,
+                gain=gain,
+                seed=seed,
+                block_rows=block_rows,
+                n_threads=n_threads,
+                gauss_above=gauss_above,
+                dtype=dtype,
+            )
+
+            # Save results to file
+            fits.HDUList(
+                image_hdus(
+                    im_noise,
+                    header,
+                    compression=compression,
+                    quantize_level=quantize_level,
+                )
+            ).writeto(result_name, overwrite=True)
+
+        if sigma_name:
+            fits.HDUList(
+                image_hdus(
+                    im_sigma,
+                    header,
+                    compression=compression,
+                    quantize_level=quantize_level,
+                )
+            ).writeto(sigma_name, overwrite=True)
+
+        print('noise_sigma: done.')
 
 # EOF
@@ -9,11 +9,24 @@
 plot_style.py
 This *.py file provides plot styles.
 
-@ Last updates: 20. Juni 2023
+@ Last updates: 19. Okt 2026
 @ To-do: ok.
 """
 
-from matplotlib import legend_handler, patheffects
+import contextlib
+import functools
+from collections.abc import Iterator
+
+import matplotlib as mpl
+import numpy as np
+from matplotlib import (
+    artist,
+    collections,
+    font_manager,
+    legend_handler,
+    lines,
+    patheffects,
+)
 
 # ---
 
@@ -87,6 +100,24 @@ RCPARAMS_UPDATE = {
     'savefig.dpi': 300,
 }
 
+# Rcparams configuration for fast rendering of huge artists, e.g.,
+# long trajectories or full-frame images
+RCPARAMS_FAST = {
+    # Paths
+    'path.simplify': True,
+    'path.simplify_threshold': 1.0,
+    'agg.path.chunksize': 10000,
+    # Images
+    'image.interpolation': 'nearest',
+    'image.resample': False,
+}
+
+# Artists with at least this many points are rasterised in fast mode
+RASTERISE_MIN_POINTS = 10000
+
+# Font families to try in order, the first one found is used
+FONT_FAMILIES = ('FreeSerif', 'STIXGeneral', 'DejaVu Serif')
+
 # Handler map used for creating legend handlers
 HANDLER_MAP = {
     list: legend_handler.HandlerTuple(ndivide=None),
@@ -103,4 +134,125 @@ PATH_EFFECTS_3 = [
     patheffects.Normal(),
 ]
 
+
+@functools.lru_cache(maxsize=None)
+def resolve_font_family(families: tuple[str, ...] = FONT_FAMILIES) -> str:
+    """
+    resolve_font_family function returns the first installed font
+    family. The result is cached, so that matplotlib's font fallback
+    search is paid only once per process.
+
+    Args:
+        families (tuple[str, ...], optional): font families to try in
+            order. Defaults to FONT_FAMILIES.
+
+    Returns:
+        str: font family, 'serif' if none is found.
+    """
+
+    for _family in families:
+
+        try:
+            font_manager.findfont(
+                font_manager.FontProperties(family=_family),
+                fallback_to_default=False,
+            )
+        except ValueError as _:
+            continue
+
+        return _family
+
+    return 'serif'
+
+
+def rcparams(fast: bool = False) -> dict:
+    """
+    rcparams function returns RCPARAMS_UPDATE with resolved font family,
+    optionally updated with RCPARAMS_FAST.
+
+    Args:
+        fast (bool, optional): whether to use fast rendering.
+            Defaults to False.
+
+    Returns:
+        dict: rcparams.
+    """
+
+    params = dict(RCPARAMS_UPDATE)
+    params['font.family'] = resolve_font_family()
+
+    if fast:
+        params.update(RCPARAMS_FAST)
+
+    return params
+
+
+@contextlib.contextmanager
+def style(*updates: dict, fast: bool = False) -> Iterator[None]:
+    """
+    style function is a context manager that applies plot styles and
+    restores previous rcparams on exit.
+
+    Args:
+        *updates (dict): further rcparams, applied in order.
+        fast (bool, optional): whether to use fast rendering.
+            Defaults to False.
+
+    Yields:
+        Iterator[None]: context.
+    """
+
+    params = rcparams(fast=fast)
+
+    for _u in updates:
+        params.update(_u)
+
+    with mpl.rc_context(params):
+        yield
+
+
+def rasterise_dense(
+    obj: artist.Artist, min_points: int = RASTERISE_MIN_POINTS
+) -> int:
+    """
+    rasterise_dense function rasterises dense artists of a figure or
+    axes, i.e., lines and collections with at least `min_points`
+    vertices, offsets or mesh cells, so that vector outputs stay small
+    and fast to render. Images are always embedded as raster and need
+    no rasterisation.
+
+    Args:
+        obj (artist.Artist): figure or axes.
+        min_points (int, optional): minimum number of vertices,
+            offsets or mesh cells.
+            Defaults to RASTERISE_MIN_POINTS.
+
+    Returns:
+        int: number of rasterised artists.
+    """
+
+    n_rasterised = 0
+
+    for _a in obj.findobj():
+
+        if isinstance(_a, lines.Line2D):
+            _n = len(_a.get_xdata(orig=False))
+        elif isinstance(_a, collections.QuadMesh):
+            # Avoid building one path per cell
+            _n = int(np.prod(_a.get_coordinates().shape[:-1]))
+        elif isinstance(_a, collections.Collection):
+            _n = max(
+                len(_a.get_offsets()),
+                sum(len(_p.vertices) for _p in _a.get_paths()),
+            )
+        else:
+            continue
+
+        if _n >= min_points:
+            _a.set_rasterized(True)
+            n_rasterised += 1
+
+    return n_rasterised
+
+
 # EOF
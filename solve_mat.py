@@ -27,7 +27,7 @@ from matplotlib import pyplot as plt
 try:
     import plot_style
 
-    plt.rcParams.update(plot_style.RCPARAMS_UPDATE)
+    plt.rcParams.update(plot_style.rcparams())
 except ImportError as _:
     pass
 
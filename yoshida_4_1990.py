@@ -10,7 +10,7 @@ yoshida_4_1990.py
 This *.py file provides the 4-th order motion integration algorithm
 as is described by Yoshida (1990). The algorithm is symplectic.
 
-@ Last updates: 3. Juli 2023
+@ Last updates: 19. Okt 2026
 @ To-do: ok.
 """
 
@@ -154,4 +154,202 @@ def yoshida_4(
     return (x_tdt, v_tdt)
 
 
+def dt_acceleration(
+    pos: np.ndarray, vel: np.ndarray, acc_val: np.ndarray, eta: float = 0.01
+) -> np.ndarray:
+    """
+    dt_acceleration function returns acceleration-based step length,
+    `eta * |v| / |a|`, i.e., a fraction of the time scale on which the
+    velocity changes.
+
+    Args:
+        pos (np.ndarray): position vectors, in shape (N, D).
+        vel (np.ndarray): velocity vectors, in shape (N, D).
+        acc_val (np.ndarray): acceleration vectors, in shape (N, D).
+        eta (float, optional): accuracy parameter. Defaults to 0.01.
+
+    Returns:
+        np.ndarray: step lengths, in shape (N,).
+    """
+
+    return (
+        eta
+        * np.sqrt(np.sum(np.square(vel), axis=-1))
+        / np.sqrt(np.sum(np.square(acc_val), axis=-1))
+    )
+
+
+def dt_period(
+    pos: np.ndarray, vel: np.ndarray, acc_val: np.ndarray, eta: float = 0.01
+) -> np.ndarray:
+    """
+    dt_period function returns orbital-period-based step length,
+    `eta * 2 pi sqrt(|x| / |a|)`, i.e., a fraction of the local circular
+    orbital period.
+
+    Args:
+        pos (np.ndarray): position vectors, in shape (N, D).
+        vel (np.ndarray): velocity vectors, in shape (N, D).
+        acc_val (np.ndarray): acceleration vectors, in shape (N, D).
+        eta (float, optional): accuracy parameter. Defaults to 0.01.
+
+    Returns:
+        np.ndarray: step lengths, in shape (N,).
+    """
+
+    return (
+        eta
+        * 2.0
+        * np.pi
+        * np.sqrt(
+            np.sqrt(np.sum(np.square(pos), axis=-1))
+            / np.sqrt(np.sum(np.square(acc_val), axis=-1))
+        )
+    )
+
+
+def block_motion_solver(
+    acc: Callable,
+    pos_0: np.ndarray,
+    vel_0: np.ndarray,
+    t_0: float = 0.0,
+    dt: float = 0.01,
+    t_max: float = 1.0,
+    n_levels: int = 8,
+    criterion: Callable = dt_period,
+    eta: float = 0.01,
+    method: Callable = yoshida_4,
+    info: dict | None = None,
+    **kw_args
+) -> list[tuple[float, np.ndarray, np.ndarray]]:
+    """
+    block_motion_solver function solves dimensionless equation of motion
+    of an ensemble of independent particles, e.g., test particles in a
+    galaxy potential, with hierarchical block time-steps.
+
+    Each particle is assigned a level l in [0, n_levels), and advances
+    with step length `dt / 2 ** l`, where l is the smallest level whose
+    step length does not exceed `criterion(pos, vel, acc, eta)`, or
+    level 0 where the criterion is not finite. Only
+    particles active at each sub-step are advanced, in groups of equal
+    level. A step is accepted only if the criterion, evaluated at both
+    its start and end, allows its level; otherwise it is redone at a
+    finer level, which keeps the step length symmetric at level
+    boundaries. A particle may coarsen by one level per step, and only
+    when its time is aligned with the coarser block. All particles are
+    synchronised every `dt`.
+
+    Args:
+        acc (Callable): acceleration of equation of motion.
+            Callable object `acc` should be defined in the form of
+            `acc(pos, vel, t, ...)`, returning acceleration vectors of
+            all particles given, in shape (N, D).
+        pos_0 (np.ndarray): initial position vectors, in shape (N, D).
+        vel_0 (np.ndarray): initial velocity vectors, in shape (N, D).
+        t_0 (float, optional): initial time. Defaults to 0.0.
+        dt (float, optional): step length of level 0, i.e., the
+            largest step length and the interval between snapshots.
+            Defaults to 0.01.
+        t_max (float, optional): maximum time to evaluate.
+            Defaults to 1.0.
+        n_levels (int, optional): number of levels. Defaults to 8.
+        criterion (Callable, optional): step length criterion, in the
+            form of `criterion(pos, vel, acc_val, eta)` returning step
+            lengths, in shape (N,). Defaults to dt_period.
+        eta (float, optional): accuracy parameter of criterion.
+            Defaults to 0.01.
+        method (Callable, optional): method for single-step
+            integration, see motion_solver. Defaults to yoshida_4.
+        info (dict | None, optional): if given, updated with number of
+            acceleration evaluations summed over particles 'n_acc',
+            number of particle steps per level 'n_steps' and final
+            levels 'levels'.
+            Defaults to None.
+
+    Returns:
+        list[tuple[float, np.ndarray, np.ndarray]]: times, position
+        vectors, velocity vectors at each synchronised snapshot.
+    """
+
+    pos = np.array(pos_0, dtype=np.float64, ndmin=2)
+    vel = np.array(vel_0, dtype=np.float64, ndmin=2)
+    n = pos.shape[0]
+
+    # Integer time ticks, the finest level advances by one tick
+    ticks_sync = 2 ** (n_levels - 1)
+    dt_tick = dt / ticks_sync
+    ticks_level = ticks_sync // np.power(2, np.arange(n_levels))
+
+    def _levels(_pos, _vel, _t):
+        _acc = acc(_pos, _vel, _t, **kw_args)
+
+        # Undefined criterion, e.g., 0 / 0 at rest, falls back to level 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _dt = criterion(_pos, _vel, _acc, eta)
+
+        _dt = np.clip(np.nan_to_num(_dt, nan=dt, posinf=dt), dt_tick, dt)
+        _l = np.ceil(np.log2(dt / _dt))
+
+        return np.clip(_l, 0, n_levels - 1).astype(np.int64)
+
+    ticks = np.zeros(n, dtype=np.int64)
+    levels = _levels(pos, vel, t_0)
+    n_acc = n
+    n_steps = np.zeros(n_levels, dtype=np.int64)
+
+    results = [(t_0, pos.copy(), vel.copy())]
+    n_sync = int(np.ceil((t_max - t_0) / dt - 1e-12))
+
+    for _k in tqdm.tqdm(range(1, n_sync + 1)):
+        _target = _k * ticks_sync
+
+        while np.any(ticks < _target):
+            _ends = ticks + ticks_level[levels]
+            _active = _ends == np.min(_ends)
+
+            for _l in np.unique(levels[_active]):
+                _ids = np.flatnonzero(_active & (levels == _l))
+                _t = t_0 + ticks[_ids[0]] * dt_tick
+                _h = ticks_level[_l] * dt_tick
+
+                (_pos, _vel) = method(
+                    acc=acc,
+                    pos=pos[_ids],
+                    vel=vel[_ids],
+                    t=_t,
+                    dt=_h,
+                    **kw_args
+                )
+                _levels_end = _levels(_pos, _vel, _t + _h)
+                n_acc += 4 * _ids.size
+                n_steps[_l] += _ids.size
+
+                # Redo steps whose end requires a finer level
+                _reject = _levels_end > _l
+                levels[_ids[_reject]] = _levels_end[_reject]
+
+                _ids = _ids[~_reject]
+                pos[_ids] = _pos[~_reject]
+                vel[_ids] = _vel[~_reject]
+                ticks[_ids] += ticks_level[_l]
+
+                # Coarsen by at most one level, aligned with its block
+                _new = np.maximum(_levels_end[~_reject], _l - 1)
+                _aligned = ticks[_ids] % ticks_level[_new] == 0
+                levels[_ids] = np.where(_aligned, _new, _l)
+
+        results.append((t_0 + _k * dt, pos.copy(), vel.copy()))
+
+    if info is not None:
+        info.update(
+            {
+                'n_acc': n_acc,
+                'n_steps': n_steps,
+                'levels': levels.copy(),
+            }
+        )
+
+    return results
+
+
 # EOF